@@ -1,43 +1,499 @@
-import pandas as pd
+import argparse
+import csv
+import glob
+import hashlib
 import json
+import os
+import random
+import sqlite3
+import string
+import time
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+from association_keys import KEY_VERSION, SOURCE_PATTERNS, NgramIndex, normalize_key
+from tool_timing import PROFILERS, Timings, profiling
+
+EXCEL_PATH = 'c:/Users/miked/Team Budget App/Ontario Associations List.xlsx'
+EXTRACTED_PATH = 'all-extraction-results.json'
+OUTPUT_PATH = 'new-associations-to-process.json'
+COLUMNS = ['Association Name', 'Location', 'League Name']
+CHUNK_SIZE = 10000
+NEAR_MISS_PATH = 'fuzzy-near-misses.json'
+FUZZY_THRESHOLD = 0.85
+NEAR_MISS_FLOOR = 0.6
+INDEX_PATH = 'extraction-index.sqlite'
+# Outputs of consolidate-extractions.py
+CONSOLIDATED_SUFFIXES = ('.arrow', '.parquet')
+# Result files whose associations count as already processed in --index mode;
+# the same files consolidate-extractions.py reads, plus the contacts sheet
+RESULT_PATTERNS = SOURCE_PATTERNS + ['hockey-associations-contacts.csv']
+
+
+def load_associations(path):
+    # Read Excel file
+    df = pd.read_excel(path)
+
+    # Set first row as column headers and remove it from data
+    df.columns = df.iloc[0]
+    return df[1:].reset_index(drop=True)
+
+
+def iter_association_chunks(path, chunk_size=CHUNK_SIZE):
+    # Stream the workbook row by row instead of loading it whole. The sheet has a
+    # title row above the real header (read_excel takes it as the header, hence the
+    # df.iloc[0] re-header above), so skip it and read the header from the next row.
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        next(rows, None)
+        header = list(next(rows, ()))
+        missing = [c for c in COLUMNS if c not in header]
+        if missing:
+            raise SystemExit(f'Missing columns in {path}: {missing}')
+        indexes = [header.index(c) for c in COLUMNS]
+
+        chunk = []
+        blank = 0
+        for row in rows:
+            # read_excel trims trailing empty rows but keeps empty rows with data
+            # below them, so hold empty rows back until a row with data turns up
+            if all(value is None for value in row):
+                blank += 1
+                continue
+            for values in [(None,) * len(row)] * blank + [row]:
+                # Empty cells come back as None; read_excel gives NaN, which str()s to 'nan'
+                chunk.append([
+                    values[i] if i < len(values) and values[i] is not None else float('nan')
+                    for i in indexes
+                ])
+                if len(chunk) == chunk_size:
+                    yield pd.DataFrame(chunk, columns=COLUMNS, dtype=object)
+                    chunk = []
+            blank = 0
+        if chunk:
+            yield pd.DataFrame(chunk, columns=COLUMNS, dtype=object)
+    finally:
+        wb.close()
+
+
+def load_extracted_names(path):
+    if path.endswith(CONSOLIDATED_SUFFIXES):
+        # Consolidated table from consolidate-extractions.py (the .arrow one
+        # memory-mapped); its rows are keyed on normalize_key(), so the sheet has
+        # to be matched on it too
+        if path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            table = pq.read_table(path, columns=['key'])
+        else:
+            import pyarrow.feather as feather
+            table = feather.read_table(path, columns=['key'], memory_map=True)
+        return set(table.column('key').to_pylist())
+
+    # Load our previously extracted associations
+    with open(path, 'r') as f:
+        extracted = json.load(f)
+
+    return set(result['association'].lower() for result in extracted)
+
+
+def read_result_names(path):
+    # Association names from one result file; older batches use 'name' / 'Association Name'
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                name = row.get('Association Name') or row.get('Association')
+                if name:
+                    yield name
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    for result in results:
+        name = result.get('association') or result.get('name')
+        if name:
+            yield name
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def update_index(db_path, patterns=RESULT_PATTERNS, rebuild=False):
+    # Keep an on-disk set of processed normalize_key() keys, re-reading only result
+    # files whose size/mtime changed and whose content hash actually differs.
+    # Keys stored under another KEY_VERSION are dropped and every file re-read.
+    if rebuild and os.path.exists(db_path):
+        os.remove(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS meta (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sources (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS association_keys (
+            key TEXT NOT NULL,
+            source TEXT NOT NULL,
+            PRIMARY KEY (key, source)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS association_keys_key ON association_keys (key);
+    ''')
+
+    stats = {'scanned': 0, 'updated': 0, 'removed': 0, 'rekeyed': False}
+    version = conn.execute("SELECT value FROM meta WHERE name = 'key_version'").fetchone()
+    if version is None or version[0] != str(KEY_VERSION):
+        with conn:
+            stats['rekeyed'] = conn.execute('SELECT COUNT(*) FROM sources').fetchone()[0] > 0
+            conn.execute('DELETE FROM association_keys')
+            conn.execute('DELETE FROM sources')
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('key_version', ?)", (str(KEY_VERSION),))
+
+    paths = sorted(set(p for pattern in patterns for p in glob.glob(pattern)))
+    known = {row[0]: row[1:] for row in conn.execute('SELECT path, mtime_ns, size, sha256 FROM sources')}
+    stats['scanned'] = len(paths)
+
+    with conn:
+        for path in known.keys() - set(paths):
+            conn.execute('DELETE FROM association_keys WHERE source = ?', (path,))
+            conn.execute('DELETE FROM sources WHERE path = ?', (path,))
+            stats['removed'] += 1
+
+        for path in paths:
+            st = os.stat(path)
+            previous = known.get(path)
+            if previous and previous[:2] == (st.st_mtime_ns, st.st_size):
+                continue
+
+            sha = file_sha256(path)
+            if not previous or previous[2] != sha:
+                conn.execute('DELETE FROM association_keys WHERE source = ?', (path,))
+                conn.executemany(
+                    'INSERT OR IGNORE INTO association_keys (key, source) VALUES (?, ?)',
+                    ((normalize_key(name), path) for name in read_result_names(path)),
+                )
+                stats['updated'] += 1
+            conn.execute(
+                'INSERT OR REPLACE INTO sources (path, mtime_ns, size, sha256) VALUES (?, ?, ?, ?)',
+                (path, st.st_mtime_ns, st.st_size, sha),
+            )
+
+    return conn, stats
+
+
+def indexed_names(conn):
+    return set(row[0] for row in conn.execute('SELECT DISTINCT key FROM association_keys'))
+
+
+def match_key_for(path):
+    # How sheet names are keyed to compare them with load_extracted_names(path);
+    # None means lowercased. The --index keys are normalize_key() too.
+    return normalize_key if path.endswith(CONSOLIDATED_SUFFIXES) else None
+
+
+def find_new_associations(df, extracted_names, match_key=None):
+    # Anti-join on the name key (lowercased, or match_key(name)): keep rows whose
+    # key is not already extracted. map(str) matches the str(row[...]) boxing of
+    # the old loop, NaN included ('nan'); astype(str) keeps NaN as missing on
+    # newer pandas.
+    names = df['Association Name'].map(str)
+    keys = names.map(match_key) if match_key else names.str.lower()
+    mask = ~keys.isin(extracted_names) & (names != 'nan')
+
+    new = pd.DataFrame({
+        'name': names[mask],
+        'location': df.loc[mask, 'Location'].map(str),
+        'league': df.loc[mask, 'League Name'].map(str),
+    })
+    return new.to_dict('records')
+
+
+def fuzzy_filter(new_associations, extracted_names, threshold=FUZZY_THRESHOLD, floor=NEAR_MISS_FLOOR):
+    # Second pass over exact-match survivors: drop names within `threshold` of an
+    # extracted one and collect every pair scoring at least `floor` for review.
+    # A threshold below the floor lowers the floor with it, or the index would
+    # never return the matches it is meant to skip.
+    floor = min(floor, threshold)
+    index = NgramIndex(sorted(extracted_names), floor)
+    matches = index.best_matches([assoc['name'] for assoc in new_associations])
+    kept, pairs = [], []
+    for assoc, (match, score) in zip(new_associations, matches):
+        if score >= floor:
+            pairs.append({
+                'name': assoc['name'],
+                'location': assoc['location'],
+                'matched': match,
+                'score': round(score, 4),
+                'skipped': score >= threshold,
+            })
+        if score < threshold:
+            kept.append(assoc)
+    pairs.sort(key=lambda pair: pair['score'], reverse=True)
+    return kept, pairs
+
+
+def find_new_associations_loop(df, extracted_names):
+    # Original per-row implementation, kept as the reference for --benchmark
+    new_associations = []
+    for i, row in df.iterrows():
+        assoc_name = str(row['Association Name'])
+        if assoc_name.lower() not in extracted_names and assoc_name != 'nan':
+            new_associations.append({
+                'name': assoc_name,
+                'location': str(row['Location']),
+                'league': str(row['League Name'])
+            })
+    return new_associations
+
+
+def synthetic_associations(rows):
+    # Sheet-shaped frame with blank names, missing leagues and mixed-case duplicates
+    names = [f'Association {i % (rows // 2 or 1)}' for i in range(rows)]
+    for i in range(0, rows, 97):
+        names[i] = float('nan')
+    for i in range(1, rows, 5):
+        names[i] = names[i].upper() if isinstance(names[i], str) else names[i]
+    return pd.DataFrame({
+        'Association Name': names,
+        'Location': [f'Town {i % 500}, ON' for i in range(rows)],
+        'League Name': [float('nan') if i % 7 == 0 else 'OMHA' for i in range(rows)],
+    }, dtype=object)
+
+
+def run_benchmark(rows):
+    df = synthetic_associations(rows)
+    extracted_names = set(f'association {i}' for i in range(0, rows // 2, 3))
+
+    start = time.perf_counter()
+    expected = find_new_associations_loop(df, extracted_names)
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = find_new_associations(df, extracted_names)
+    vectorized_seconds = time.perf_counter() - start
+
+    if json.dumps(actual, indent=2) != json.dumps(expected, indent=2):
+        raise SystemExit('Benchmark mismatch: vectorized output differs from iterrows loop')
+
+    print(f'Synthetic sheet: {rows} rows, {len(expected)} new associations')
+    print(f'iterrows loop:   {loop_seconds:.3f}s')
+    print(f'vectorized:      {vectorized_seconds:.3f}s')
+    print(f'Speedup:         {loop_seconds / vectorized_seconds:.1f}x')
+
+
+def best_matches_loop(names, extracted_names, floor=NEAR_MISS_FLOOR):
+    # Per-name trigram Dice scorer over plain dict postings, kept as the
+    # reference for --fuzzy-benchmark
+    def trigrams(key):
+        padded = f' {key} '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    indexed, postings, seen = [], defaultdict(list), set()
+    for name in sorted(extracted_names):
+        key = normalize_key(name)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        grams = trigrams(key)
+        for gram in grams:
+            postings[gram].append(len(indexed))
+        indexed.append((name, len(grams)))
+
+    matches = []
+    for name in names:
+        grams = trigrams(normalize_key(name))
+        shared = Counter(i for gram in grams for i in postings.get(gram, ()))
+        best = (None, 0.0)
+        for i, count in sorted(shared.items()):
+            score = 2 * count / (len(grams) + indexed[i][1])
+            if score >= floor and score > best[1]:
+                best = (indexed[i][0], score)
+        matches.append(best)
+    return matches
+
+
+def synthetic_fuzzy_names(rows, seed=0):
+    # Extracted names and sheet names built from the same word pool, with every
+    # tenth sheet name a one-letter typo of an extracted one
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(rows // 6 + 1)]
+    extracted_names = {f'{rng.choice(words)} {rng.choice(words)}' for _ in range(rows)}
+    pool = sorted(extracted_names)
+    names = []
+    for i in range(rows):
+        if i % 10 == 0:
+            chars = list(rng.choice(pool))
+            chars[rng.randrange(len(chars))] = rng.choice(string.ascii_lowercase)
+            names.append(''.join(chars).title())
+        else:
+            names.append(f'{rng.choice(words).title()} {rng.choice(words).title()} Minor Hockey Association')
+    return names, extracted_names
+
+
+def run_fuzzy_benchmark(rows, sample=1000):
+    names, extracted_names = synthetic_fuzzy_names(rows)
+    new_associations = [{'name': name, 'location': 'Town, ON', 'league': 'OMHA'} for name in names]
+
+    start = time.perf_counter()
+    index = NgramIndex(sorted(extracted_names), NEAR_MISS_FLOOR)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    matches = index.best_matches(names)
+    query_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    kept, pairs = fuzzy_filter(new_associations, extracted_names)
+    filter_seconds = time.perf_counter() - start
+
+    # The reference scorer is slow, so check it on an even sample of the names
+    step = max(1, len(names) // sample)
+    checked = names[::step]
+    start = time.perf_counter()
+    expected = best_matches_loop(checked, extracted_names)
+    loop_seconds = time.perf_counter() - start
+    if expected != matches[::step]:
+        raise SystemExit('Benchmark mismatch: NgramIndex differs from the per-name scorer')
+
+    print(f'Synthetic names: {rows} sheet x {len(extracted_names)} extracted, {len(pairs)} pairs >= {NEAR_MISS_FLOOR}')
+    print(f'index build:     {build_seconds:.3f}s')
+    print(f'batched queries: {query_seconds:.3f}s')
+    print(f'fuzzy_filter:    {filter_seconds:.3f}s')
+    print(f'per-name loop:   {loop_seconds / len(checked) * len(names):.3f}s (extrapolated from {len(checked)} names)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find Ontario associations we have not extracted yet')
+    parser.add_argument('--excel', default=EXCEL_PATH, help='Ontario associations workbook')
+    parser.add_argument('--extracted', default=EXTRACTED_PATH, help='Extraction results JSON, or the .arrow/.parquet table from consolidate-extractions.py')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='Where to write new associations')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read the workbook in fixed-size chunks instead of loading it whole')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'Rows per chunk in --stream mode (default {CHUNK_SIZE})')
+    parser.add_argument('--index', action='store_true',
+                        help=f'Check against the incremental index of every result file ({INDEX_PATH})')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Rebuild the index from scratch (implies --index)')
+    parser.add_argument('--fuzzy', action='store_true',
+                        help='Also skip near-duplicate names of already extracted associations')
+    parser.add_argument('--fuzzy-threshold', type=float, default=FUZZY_THRESHOLD,
+                        help=f'Similarity at which a name counts as already extracted (default {FUZZY_THRESHOLD})')
+    parser.add_argument('--near-misses', default=NEAR_MISS_PATH,
+                        help=f'Where --fuzzy writes scored near-miss pairs (default {NEAR_MISS_PATH})')
+    parser.add_argument('--benchmark', type=int, metavar='ROWS',
+                        help='Compare the vectorized anti-join with the iterrows loop on a synthetic sheet')
+    parser.add_argument('--fuzzy-benchmark', type=int, metavar='ROWS',
+                        help='Time --fuzzy matching of ROWS synthetic names against ROWS extracted ones')
+    parser.add_argument('--timing', help='Timing summary JSON (default: OUTPUT with a -timing.json suffix)')
+    parser.add_argument('--profile', choices=PROFILERS,
+                        help='Also dump a profile next to the timing summary (or set TOOL_PROFILE)')
+    args = parser.parse_args()
+
+    if not 0 < args.fuzzy_threshold <= 1:
+        parser.error('--fuzzy-threshold must be above 0 and at most 1')
+    if args.benchmark:
+        run_benchmark(args.benchmark)
+        return
+    if args.fuzzy_benchmark:
+        run_fuzzy_benchmark(args.fuzzy_benchmark)
+        return
+
+    timing_path = args.timing or f'{os.path.splitext(args.output)[0]}-timing.json'
+    timings = Timings('analyze-excel')
+    with profiling(args.profile, os.path.splitext(timing_path)[0]) as profile_path:
+        reconcile(args, timings)
+
+    summary = timings.write(timing_path)
+    peak = summary['peak_rss_mb']
+    print(f'Peak RSS: {peak:.1f} MB' if peak is not None else 'Peak RSS: unavailable')
+    print(f'Timing summary saved to: {timing_path}')
+    if profile_path:
+        print(f'Profile saved to: {profile_path}')
+
+
+def reconcile(args, timings):
+    if args.index or args.rebuild:
+        with timings.span('index_update'):
+            conn, stats = update_index(INDEX_PATH, rebuild=args.rebuild)
+            extracted_names = indexed_names(conn)
+            conn.close()
+        if stats['rekeyed']:
+            print(f'Index: matching key changed (version {KEY_VERSION}), re-indexing every result file')
+        print(f'Index: {stats["scanned"]} result files, {stats["updated"]} re-indexed, '
+              f'{stats["removed"]} removed')
+        match_key = normalize_key
+    else:
+        with timings.span('json_load'):
+            extracted_names = load_extracted_names(args.extracted)
+        match_key = match_key_for(args.extracted)
+
+    if args.stream:
+        # Reconcile chunk by chunk so only one chunk of the sheet is alive at a time
+        total = 0
+        new_associations = []
+        with timings.span('stream'):
+            chunks = iter_association_chunks(args.excel, args.chunk_size)
+            while True:
+                with timings.span('excel_parse'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                total += len(chunk)
+                with timings.span('reconcile'):
+                    new_associations.extend(find_new_associations(chunk, extracted_names, match_key))
+
+        print(f'Total associations in Excel: {total}')
+        print(f'\nColumns: {COLUMNS}')
+    else:
+        with timings.span('excel_parse'):
+            df = load_associations(args.excel)
+
+        print(f'Total associations in Excel: {len(df)}')
+        print(f'\nColumns: {list(df.columns)}')
 
-# Read Excel file
-df = pd.read_excel('c:/Users/miked/Team Budget App/Ontario Associations List.xlsx')
+        # Find new associations
+        with timings.span('reconcile'):
+            new_associations = find_new_associations(df, extracted_names, match_key)
 
-# Set first row as column headers and remove it from data
-df.columns = df.iloc[0]
-df = df[1:].reset_index(drop=True)
+    print(f'\nAlready extracted: {len(extracted_names)} associations')
 
-print(f'Total associations in Excel: {len(df)}')
-print(f'\nColumns: {list(df.columns)}')
+    if args.fuzzy:
+        with timings.span('fuzzy'):
+            new_associations, pairs = fuzzy_filter(new_associations, extracted_names, args.fuzzy_threshold)
+        skipped = sum(pair['skipped'] for pair in pairs)
 
-# Load our previously extracted associations
-with open('all-extraction-results.json', 'r') as f:
-    extracted = json.load(f)
+        with open(args.near_misses, 'w') as f:
+            json.dump(pairs, f, indent=2)
 
-extracted_names = set(result['association'].lower() for result in extracted)
+        print(f'Fuzzy matching: skipped {skipped} near-duplicates, '
+              f'{len(pairs)} near-miss pairs saved to {args.near_misses} '
+              f'({timings.spans["fuzzy"]["total_seconds"]:.3f}s)')
 
-print(f'\nAlready extracted: {len(extracted_names)} associations')
+    print(f'New associations to process: {len(new_associations)}')
 
-# Find new associations
-new_associations = []
-for i, row in df.iterrows():
-    assoc_name = str(row['Association Name'])
-    if assoc_name.lower() not in extracted_names and assoc_name != 'nan':
-        new_associations.append({
-            'name': assoc_name,
-            'location': str(row['Location']),
-            'league': str(row['League Name'])
-        })
+    print('\nFirst 30 new associations:')
+    for i, assoc in enumerate(new_associations[:30], 1):
+        print(f'{i}. {assoc["name"]} - {assoc["location"]} ({assoc["league"]})')
 
-print(f'New associations to process: {len(new_associations)}')
+    # Save list of new associations
+    with timings.span('write_output'):
+        with open(args.output, 'w') as f:
+            json.dump(new_associations, f, indent=2)
 
-print('\nFirst 30 new associations:')
-for i, assoc in enumerate(new_associations[:30], 1):
-    print(f'{i}. {assoc["name"]} - {assoc["location"]} ({assoc["league"]})')
+    print(f'\nSaved {len(new_associations)} new associations to: {args.output}')
 
-# Save list of new associations
-with open('new-associations-to-process.json', 'w') as f:
-    json.dump(new_associations, f, indent=2)
 
-print(f'\nSaved {len(new_associations)} new associations to: new-associations-to-process.json')
+if __name__ == '__main__':
+    main()
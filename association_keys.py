@@ -0,0 +1,272 @@
+"""
+Association name normalization, fuzzy matching and result-file discovery shared
+by the extraction tooling
+"""
+import re
+
+import numpy as np
+
+# Extraction result files: every association in them counts as processed
+SOURCE_PATTERNS = [
+    '*batch-*-results.json',
+    '*batch-*-results.csv',
+    '*extraction-results.json',
+    '*extraction-results.csv',
+]
+
+# Trailing words that vary between the Ontario list and our extraction results
+SUFFIXES = [
+    'minor hockey association',
+    'minor hockey assoc',
+    'minor hockey',
+    'hockey association',
+    'hockey club',
+    'association',
+    'assoc',
+    'mha',
+    'inc',
+]
+_SUFFIX_RE = re.compile(r'(?:\s+(?:' + '|'.join(re.escape(s) for s in SUFFIXES) + r'))+$')
+_GIRLS_RE = re.compile(r'\bgirls?\s+only\b')
+_PUNCT_RE = re.compile(r'[^a-z0-9]+')
+# ASCII names skip the regexes: punctuation maps to spaces, and suffixes are
+# peeled off the end, looked up by the last word in SUFFIXES order
+_ASCII_PUNCT = bytes(c if chr(c).isalnum() else ord(' ') for c in range(256))
+_SUFFIX_ENDINGS = {}
+for _suffix in SUFFIXES:
+    _SUFFIX_ENDINGS.setdefault(_suffix.split()[-1], []).append(' ' + _suffix)
+# Bump whenever normalize_key() changes, so stored keys get rebuilt
+KEY_VERSION = 1
+
+# Bits in each n-gram set's hashed signature (a power of two, at least 64)
+SIGNATURE_BITS = 256
+# Names best_matches() scores per batch of array operations
+QUERY_BATCH = 4096
+
+
+def normalize_key(name):
+    """Matching key for an association name: lowercase, no punctuation, no
+    'Girls Only' marker and no generic 'Minor Hockey Association' style suffix."""
+    key = str(name).lower().split('|')[0]
+    key = key.replace('&', ' and ')
+    if 'girl' in key:
+        key = _GIRLS_RE.sub(' ', key)
+    if not key.isascii():
+        key = _PUNCT_RE.sub(' ', key).strip()
+        stripped = _SUFFIX_RE.sub('', key)
+        # Don't strip a name down to nothing ("Hockey Association" on its own)
+        return stripped or key
+
+    # Same result as the regexes above, several times faster on the common case
+    key = ' '.join(key.encode().translate(_ASCII_PUNCT).decode().split())
+    stripped = key
+    while True:
+        for ending in _SUFFIX_ENDINGS.get(stripped[stripped.rfind(' ') + 1:], ()):
+            if stripped.endswith(ending):
+                stripped = stripped[:-len(ending)]
+                break
+        else:
+            return stripped or key
+
+
+def min_overlap(size, min_score):
+    # Fewest shared n-grams a set of `size` needs with any set to reach Dice >= min_score
+    return np.maximum(1, np.ceil(min_score * np.asarray(size) / (2 - min_score) - 1e-9)).astype(np.int64)
+
+
+def _needed(min_score, count):
+    # Shared grams two sets need to reach Dice >= min_score, by their summed size
+    return np.ceil(min_score * np.arange(count) / 2 - 1e-9).astype(np.int64)
+
+
+def _distinct(values):
+    values = np.sort(values)
+    return values[np.r_[True, values[1:] != values[:-1]]] if len(values) else values
+
+
+def _ngram_codes(keys, n):
+    # Distinct n-grams of every padded key as int64 codes (21 bits per code point),
+    # with the index of the key each came from; sorted by key, then code
+    if not keys:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    padded = np.array([f' {key} ' for key in keys])
+    width = padded.dtype.itemsize // 4
+    if width < n:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    chars = padded.view(np.uint32).reshape(len(keys), width).astype(np.int64)
+    codes = chars[:, :width - n + 1]
+    for i in range(1, n):
+        codes = codes << 21 | chars[:, i:width - n + 1 + i]
+    valid = np.arange(width - n + 1) < (np.char.str_len(padded) - n + 1)[:, None]
+    # Sort each key's codes with the padding pushed past the end, then drop repeats
+    codes[~valid] = np.iinfo(np.int64).max
+    codes.sort(axis=1)
+    valid[:, 1:] &= codes[:, 1:] != codes[:, :-1]
+    return np.nonzero(valid)[0], codes[valid]
+
+
+def _signatures(rows, codes, count):
+    # Hashed bitmap of each set's n-grams. Shared n-grams set bits in the AND of
+    # two signatures, so its popcount plus the n-grams one set lost to bits it
+    # already had (size - popcount) bounds how many the sets share
+    shift = 64 - (SIGNATURE_BITS.bit_length() - 1)
+    bits = (codes.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(shift)
+    # One row per 64-bit word: gathering whole columns is much cheaper than
+    # gathering short rows for millions of pairs
+    signatures = np.zeros((SIGNATURE_BITS // 64, count), dtype=np.uint64)
+    np.bitwise_or.at(signatures, ((bits >> np.uint64(6)).astype(np.int64), rows),
+                     np.uint64(1) << (bits & np.uint64(63)))
+    return signatures
+
+
+def _popcount(signatures):
+    return np.bitwise_count(signatures).sum(axis=0, dtype=np.int64)
+
+
+class NgramIndex:
+    """Blocking index over character n-grams, queried in batches.
+
+    Similarity is the Dice coefficient of the two n-gram sets. best_matches()
+    scores a whole list of names with array operations, pruning in stages:
+
+    - prefix filter: with grams ordered rarest first, two sets can only reach
+      `min_score` if the first size - min_overlap(size) + 1 grams of each share
+      one, so only those prefix grams are indexed and probed;
+    - size and positional bounds: postings are sorted by name size, so each
+      probe reads only the names whose size can reach the score, and drops
+      those with too few grams left after the shared one;
+    - a hashed bitmap signature bounds the overlap of each remaining pair;
+    - the exact overlap is counted for the pairs that get through.
+    """
+
+    def __init__(self, names, min_score, n=3):
+        self.n = n
+        self.min_score = min_score
+        # First name per distinct key, in input order
+        first_names = {}
+        for name in names:
+            first_names.setdefault(normalize_key(name), name)
+        first_names.pop('', None)
+        keys = list(first_names)
+        self.names = list(first_names.values())
+
+        rows, codes = _ngram_codes(keys, n)
+        # Gram ids: positions in the sorted vocabulary of distinct codes
+        by_code = np.argsort(codes)
+        first = np.diff(codes[by_code], prepend=-1) != 0
+        self.vocab = codes[by_code][first]
+        grams = np.empty(len(codes), dtype=np.int64)
+        grams[by_code] = np.cumsum(first) - 1
+        self.sizes = np.bincount(rows, minlength=len(keys))
+        # Each name's gram ids as one slice, for the exact overlap count
+        self.grams = grams
+        self.starts = np.cumsum(self.sizes) - self.sizes
+        self.signatures = _signatures(rows, codes, len(keys))
+        self.collisions = self.sizes - _popcount(self.signatures)
+
+        # Rank grams rarest first and post each name under its prefix grams,
+        # grouped by rank and sorted by name size within a rank
+        self.rank = np.empty(len(self.vocab), dtype=np.int64)
+        self.rank[np.argsort(np.bincount(grams, minlength=len(self.vocab)))] = np.arange(len(self.vocab))
+        order = np.argsort(rows * len(self.vocab) + self.rank[grams])
+        rows, grams = rows[order], grams[order]
+        position = np.arange(len(rows)) - np.repeat(self.starts, self.sizes)
+        prefix = position < (self.sizes - min_overlap(self.sizes, min_score) + 1)[rows]
+        rows, grams, position = rows[prefix], grams[prefix], position[prefix]
+
+        self.size_span = int(self.sizes.max(initial=0)) + 2
+        posting_keys = self.rank[grams] * self.size_span + self.sizes[rows]
+        by_key = np.argsort(posting_keys)
+        self.posting_keys = posting_keys[by_key]
+        self.postings = rows[by_key].astype(np.int32)
+        # Largest query a posting can still match: the pair needs
+        # needed(query size + name size) shared grams, and the name has only
+        # `left` grams from the posted one on (in rank order) to share
+        left = (self.sizes[rows] - position)[by_key]
+        needed = _needed(min_score, int(2 * self.size_span / min_score) + 3)
+        self.posting_fit = (np.searchsorted(needed, left, side='right') - 1 - self.sizes[rows][by_key]).astype(np.int32)
+
+    def best_match(self, name):
+        """Return (indexed name, Dice score) of the closest name scoring at least
+        `min_score`, or (None, 0.0) when there is none."""
+        return self.best_matches([name])[0]
+
+    def best_matches(self, names, batch_size=QUERY_BATCH):
+        """best_match() for every name, `batch_size` names at a time."""
+        matches = []
+        for start in range(0, len(names), batch_size):
+            matches.extend(self._best_matches(names[start:start + batch_size]))
+        return matches
+
+    def _best_matches(self, names):
+        matches = [(None, 0.0)] * len(names)
+        rows, codes = _ngram_codes([normalize_key(name) for name in names], self.n)
+        if not len(rows) or not len(self.names):
+            return matches
+        t = self.min_score
+        sizes = np.bincount(rows, minlength=len(names))
+        # Shared grams a pair with these two sizes summed needs to reach t
+        needed = _needed(t, sizes.max() + self.size_span)
+
+        # Look the codes up in sorted order, which keeps the binary searches in cache
+        by_code = np.argsort(codes)
+        found = np.empty(len(codes), dtype=np.int64)
+        found[by_code] = np.searchsorted(self.vocab, codes[by_code])
+        found = found.clip(max=len(self.vocab) - 1)
+        known = self.vocab[found] == codes
+        grams = np.where(known, found, -1)
+        # Unknown grams rank first (rarest); nobody has them, so they are never probed
+        rank = np.where(known, self.rank[grams], -1)
+        order = np.argsort(rows * (len(self.vocab) + 1) + rank + 1)
+        position = np.arange(len(rows)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        probe = np.flatnonzero((position < (sizes - min_overlap(sizes, t) + 1)[rows[order]]) & (rank[order] >= 0))
+        # Probe in rank order so the postings lookups below run over sorted needles
+        probe = probe[np.argsort(rank[order][probe])]
+        probe_rows, probe_ranks = rows[order][probe], rank[order][probe]
+        size, left = sizes[probe_rows], sizes[probe_rows] - position[probe]
+
+        # Each probe reads the names posted under its gram whose size b can
+        # reach t: b >= t * size / (2 - t), and no more than the query's grams
+        # left from this one (if it is the first gram the pair shares) allow
+        smallest = np.ceil(t * size / (2 - t) - 1e-6).astype(np.int64)
+        largest = np.floor(2 * left / t - size + 1e-6).astype(np.int64).clip(max=self.size_span - 1)
+        starts = np.searchsorted(self.posting_keys, probe_ranks * self.size_span + smallest)
+        lengths = (np.searchsorted(self.posting_keys, probe_ranks * self.size_span + largest, side='right') - starts).clip(min=0)
+        posted = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        # Same bound from the indexed name's side; the pair's real first shared
+        # gram passes both, so hits that fail can go
+        fits = self.posting_fit[posted] >= np.repeat(size.astype(np.int32), lengths)
+        posted = posted[fits]
+        queries = np.repeat(probe_rows, lengths)[fits]
+        pairs = _distinct(queries * len(self.names) + self.postings[posted])
+        queries, candidates = pairs // len(self.names), pairs % len(self.names)
+
+        # Upper bound on the overlap from the signatures
+        signatures = _signatures(rows, codes, len(names))
+        bound = np.minimum((sizes - _popcount(signatures))[queries], self.collisions[candidates])
+        for query_word, name_word in zip(signatures, self.signatures):
+            bound += np.bitwise_count(query_word[queries] & name_word[candidates])
+        keep = bound >= needed[sizes[queries] + self.sizes[candidates]]
+        queries, candidates = queries[keep], candidates[keep]
+        if not len(queries):
+            return matches
+
+        # Exact overlap: test each of the candidate's grams against a bitmap of
+        # the query's gram ids
+        query_bits = np.zeros((len(names), len(self.vocab) // 8 + 1), dtype=np.uint8)
+        np.bitwise_or.at(query_bits, (rows[known], grams[known] >> 3), np.left_shift(1, grams[known] & 7).astype(np.uint8))
+        lengths = self.sizes[candidates]
+        pair_ids = np.repeat(np.arange(len(queries)), lengths)
+        tested = self.grams[np.repeat(self.starts[candidates] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())]
+        shared = np.bincount(pair_ids, weights=query_bits[queries[pair_ids], tested >> 3] >> (tested & 7) & 1,
+                             minlength=len(queries))
+
+        scores = 2 * shared / (sizes[queries] + self.sizes[candidates])
+        keep = scores >= t
+        queries, candidates, scores = queries[keep], candidates[keep], scores[keep]
+        # Best score per query; ties go to the earliest indexed name
+        best = np.lexsort((candidates, -scores, queries))
+        first = best[np.r_[True, queries[best][1:] != queries[best][:-1]]] if len(best) else best
+        for query, candidate, score in zip(queries[first].tolist(), candidates[first].tolist(), scores[first].tolist()):
+            matches[query] = (self.names[candidate], score)
+        return matches
@@ -0,0 +1,176 @@
+"""
+Consolidate every extraction result file into one Arrow table
+
+Loads the batch/all/fixed/retry/cloudflare result files (JSON and CSV) in
+parallel, maps their different schemas onto one set of columns and keeps one
+row per normalized association key.
+
+Dedupe rule ("latest successful wins"): a successful extraction always beats a
+failed one; among rows with the same success status the one from the most
+recently modified file wins (file name order breaks mtime ties), and within a
+file a later record beats an earlier one. "Most recently modified" is the file
+system mtime, which a git checkout or a plain copy resets: after a fresh clone
+it only reflects the order files were written out in. Keep mtimes (cp -p,
+rsync -t) when moving result files if the order matters.
+
+The output is an uncompressed Arrow IPC file, so readers can memory-map it and
+use the columns without copying (see load_consolidated). A .parquet output path
+writes Parquet instead.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from association_keys import SOURCE_PATTERNS, normalize_key
+
+OUTPUT_PATH = 'extraction-results.arrow'
+ROLES = ['president', 'vp', 'treasurer']
+# Values the scrapers wrote in email columns when there was no usable address
+EMAIL_PLACEHOLDERS = {'[email protected]'}
+COLUMNS = [
+    'key', 'association', 'location', 'website', 'success',
+    'president_name', 'president_email', 'vp_name', 'vp_email', 'treasurer_name', 'treasurer_email',
+    'error', 'notes', 'source', 'source_mtime_ns', 'record_index',
+]
+
+
+def clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def clean_email(value):
+    value = clean(value)
+    if value is None or '@' not in value or value in EMAIL_PLACEHOLDERS:
+        return None
+    return value
+
+
+def parse_success(value, emails):
+    # Older batches have no success flag; count them successful if any email came back
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip():
+        return value.strip().lower() in ('yes', 'true')
+    return any(emails)
+
+
+def normalize_json_record(result):
+    record = {
+        'association': clean(result.get('association') or result.get('name')),
+        'location': clean(result.get('location')),
+        'website': clean(result.get('website')),
+        'error': clean(result.get('error')),
+        'notes': clean(result.get('notes') or result.get('originalNotes')),
+    }
+    for role in ROLES:
+        # Either a {name, email} object per role or flat presidentEmail-style fields
+        contact = result.get(role) or {}
+        record[f'{role}_name'] = clean(contact.get('name'))
+        record[f'{role}_email'] = clean_email(contact.get('email') or result.get(f'{role}Email'))
+    record['success'] = parse_success(result.get('success'), [record[f'{role}_email'] for role in ROLES])
+    return record
+
+
+def normalize_csv_record(row):
+    record = {
+        'association': clean(row.get('Association') or row.get('Association Name')),
+        'location': clean(row.get('Location')),
+        'website': clean(row.get('Website') or row.get('Website URL')),
+        'error': None,
+        'notes': clean(row.get('Notes')),
+    }
+    for role, label in zip(ROLES, ['President', 'VP', 'Treasurer']):
+        record[f'{role}_name'] = clean(row.get(f'{label} Name'))
+        record[f'{role}_email'] = clean_email(row.get(f'{label} Email'))
+    record['success'] = parse_success(row.get('Success'), [record[f'{role}_email'] for role in ROLES])
+    return record
+
+
+def load_source(path):
+    # Runs in a worker process: parse and normalize one result file
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            records = [normalize_csv_record(row) for row in csv.DictReader(f)]
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            records = [normalize_json_record(result) for result in json.load(f)]
+
+    mtime_ns = os.stat(path).st_mtime_ns
+    rows = []
+    for i, record in enumerate(records):
+        if not record['association']:
+            continue
+        record.update(key=normalize_key(record['association']), source=path,
+                      source_mtime_ns=mtime_ns, record_index=i)
+        rows.append(record)
+    return rows
+
+
+def find_sources(patterns=SOURCE_PATTERNS):
+    return sorted(set(path for pattern in patterns for path in glob.glob(pattern)))
+
+
+def consolidate(paths, workers=None):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = [row for rows in pool.map(load_source, paths) for row in rows]
+
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    # Sort so the winning row of each key comes last, then keep it
+    df = df.sort_values(['success', 'source_mtime_ns', 'source', 'record_index'], kind='stable')
+    df = df.drop_duplicates('key', keep='last')
+    return df.sort_values('key').reset_index(drop=True)
+
+
+def write_consolidated(df, path):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        feather.write_feather(table, path, compression='uncompressed')
+
+
+def load_consolidated(path=OUTPUT_PATH):
+    """Memory-map the consolidated Arrow file and return it as a pyarrow Table."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_table(path)
+    return feather.read_table(path, memory_map=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consolidate extraction result files into one Arrow table')
+    parser.add_argument('--output', default=OUTPUT_PATH,
+                        help=f'Arrow IPC file to write, or a .parquet path (default {OUTPUT_PATH})')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    paths = find_sources()
+    print(f'Result files: {len(paths)}')
+
+    start = time.perf_counter()
+    df = consolidate(paths, args.workers)
+    write_consolidated(df, args.output)
+    consolidate_seconds = time.perf_counter() - start
+
+    print(f'Associations: {len(df)} ({int(df["success"].sum())} successful)')
+    print(f'Saved to: {args.output} in {consolidate_seconds:.3f}s')
+
+    start = time.perf_counter()
+    table = load_consolidated(args.output)
+    print(f'Reloaded {table.num_rows} rows in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,44 @@
 #!/usr/bin/env python3
 """
 Wrapper script to run UI evaluation with proper encoding on Windows
+
+Single URL:  python run_ui_evaluation.py [url] [output_dir]
+Batch mode:  python run_ui_evaluation.py [base_url] [output_dir] --routes /dashboard /budget
+             python run_ui_evaluation.py [base_url] [output_dir] --sitemap routes.txt
+Sampling:    python run_ui_evaluation.py [url] [output_dir] --warmup 2 --samples 10 --cache both
+
+Batch mode evaluates every route over a bounded pool of warm browser contexts
+and writes one combined report (batch-results.json) to the output directory.
+Screenshots go to a content-addressed store (OUTPUT_DIR/screenshots) and are only
+diffed against their baseline capture when its hash or thumbnail moved.
+With --samples every URL also gets repeated cold- and warm-cache loads with
+min/median/p95/stdev per timing metric.
+
+Batch results carry the visual, performance, functionality and responsive
+sections of evaluation-results.json but no accessibility section: the axe
+audit lives in evaluate_ui and isn't run on the pooled pages. Use single-URL
+mode for accessibility checks.
+
+Absolute sitemap locations are rebased onto the base URL (path and query only),
+so --serve and staging runs never reach the host the sitemap was built for.
 """
-import sys
+import argparse
+import asyncio
+import functools
+import json
 import os
+import re
+import statistics
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlparse
+
+import ui_perf_history
+from screenshot_store import PHASH_THRESHOLD, STORE_DIR, ScreenshotStore
+from tool_timing import PROFILERS, Timings, profiling
 
 # Set UTF-8 encoding for stdout/stderr
 if sys.platform == 'win32':
@@ -13,10 +48,524 @@ if sys.platform == 'win32':
 # Now import and run the actual evaluation
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '.claude', 'skills', 'ui-evaluator', 'scripts'))
 
-from evaluate_ui import evaluate_ui
+DEFAULT_URL = 'http://localhost:3000'
+DEFAULT_OUTPUT_DIR = './ui-evaluation-results'
+BATCH_REPORT = 'batch-results.json'
+TIMING_REPORT = 'timing.json'
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+DESKTOP_VIEWPORT = {'width': 1920, 'height': 1080}
+RESPONSIVE_VIEWPORTS = {
+    'mobile': {'width': 375, 'height': 667},
+    'tablet': {'width': 768, 'height': 1024},
+}
+
+timings = Timings('run_ui_evaluation')
+
+# Runs before any page script so layout shifts and long tasks from the first paint are counted
+PAGE_OBSERVERS = """
+window.__cls = 0;
+window.__longTasks = { count: 0, total: 0 };
+new PerformanceObserver((list) => {
+  for (const entry of list.getEntries()) {
+    if (!entry.hadRecentInput) window.__cls += entry.value;
+  }
+}).observe({ type: 'layout-shift', buffered: true });
+new PerformanceObserver((list) => {
+  for (const entry of list.getEntries()) {
+    window.__longTasks.count += 1;
+    window.__longTasks.total += entry.duration;
+  }
+}).observe({ type: 'longtask', buffered: true });
+"""
+
+TIMING_METRICS = """
+() => {
+  const nav = performance.getEntriesByType('navigation')[0];
+  const paint = Object.fromEntries(performance.getEntriesByType('paint').map((e) => [e.name, e.startTime]));
+  return {
+    metrics: {
+      domContentLoaded: nav ? Math.round(nav.domContentLoadedEventEnd) : null,
+      domInteractive: nav ? Math.round(nav.domInteractive) : null,
+      firstPaint: paint['first-paint'] != null ? Math.round(paint['first-paint']) : null,
+      firstContentfulPaint: paint['first-contentful-paint'] != null ? Math.round(paint['first-contentful-paint']) : null,
+    },
+    cumulative_layout_shift: window.__cls || 0,
+    long_tasks: { count: window.__longTasks.count, total_ms: Math.round(window.__longTasks.total) },
+  };
+}
+"""
+
+PAGE_METRICS = """
+() => {
+  const fonts = new Set();
+  document.querySelectorAll('body, body *').forEach((el) => fonts.add(getComputedStyle(el).fontFamily));
+  return {
+    fonts_used: Array.from(fonts).slice(0, 10),
+    functionality: {
+      forms_count: document.forms.length,
+      buttons_count: document.querySelectorAll('button').length,
+      links_count: document.querySelectorAll('a[href]').length,
+      interactive_elements: document.querySelectorAll('[role="button"], [tabindex]:not([tabindex="-1"])').length,
+    },
+  };
+}
+"""
+
+
+def load_routes(path):
+    """Routes from an XML sitemap (<url><loc> entries) or a text file with one route per line.
+
+    A sitemap index is followed into its child sitemaps, looked up by file name
+    next to the index (as next-sitemap and most generators write them).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    if content.lstrip().startswith('<'):
+        root = ET.fromstring(content)
+        if root.tag in (f'{SITEMAP_NS}sitemapindex', 'sitemapindex'):
+            children = root.findall(f'{SITEMAP_NS}sitemap/{SITEMAP_NS}loc') or root.findall('sitemap/loc')
+            directory = os.path.dirname(path)
+            return [
+                route for loc in children if loc.text
+                for route in load_routes(os.path.join(directory, os.path.basename(urlparse(loc.text.strip()).path)))
+            ]
+        # Only page locations: <image:loc>, <video:loc> etc. sit in other namespaces
+        locs = root.findall(f'{SITEMAP_NS}url/{SITEMAP_NS}loc') or root.findall('url/loc')
+        return [loc.text.strip() for loc in locs if loc.text]
+
+    return [line.strip() for line in content.splitlines() if line.strip() and not line.startswith('#')]
+
+
+def route_url(base_url, route):
+    # Sitemaps list absolute production URLs; only their path and query are kept
+    parts = urlparse(route)
+    if parts.scheme or parts.netloc:
+        route = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+    return urljoin(base_url, route)
+
+
+def route_slug(url):
+    # Per-route output directory name: '/' -> 'index', '/budget/approvals' -> 'budget-approvals'
+    path = urlparse(url).path.strip('/')
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', path) or 'index'
+
+
+def serve_static(directory, port=0):
+    """Serve `directory` on localhost in a background thread (stand-in for `next start`)."""
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+async def load_page(context, url, timeout):
+    """Navigate a new page in `context` to `url`; return (page, timing sample)."""
+    page = await context.new_page()
+    try:
+        await page.add_init_script(PAGE_OBSERVERS)
+        start = time.perf_counter()
+        with timings.span('navigation'):
+            await page.goto(url, wait_until='load', timeout=timeout * 1000)
+        load_time = round(time.perf_counter() - start, 2)
+        timing = await page.evaluate(TIMING_METRICS)
+    except BaseException:
+        await page.close()
+        raise
+
+    sample = dict(timing['metrics'])
+    sample.update(
+        load_time=load_time,
+        cumulative_layout_shift=timing['cumulative_layout_shift'],
+        long_task_count=timing['long_tasks']['count'],
+        long_task_ms=timing['long_tasks']['total_ms'],
+    )
+    return page, sample
+
+
+async def measure_load(context, url, timeout):
+    page, sample = await load_page(context, url, timeout)
+    await page.close()
+    return sample
+
+
+def summarize_samples(samples):
+    """min / median / p95 / stdev per metric over repeated loads."""
+    summary = {}
+    for metric in samples[0]:
+        values = [s[metric] for s in samples if s.get(metric) is not None]
+        if not values:
+            continue
+        summary[metric] = {
+            'min': min(values),
+            'median': statistics.median(values),
+            'p95': statistics.quantiles(values, n=20, method='inclusive')[18] if len(values) > 1 else values[0],
+            'stdev': round(statistics.stdev(values), 4) if len(values) > 1 else 0.0,
+        }
+    return summary
+
+
+async def sample_route(browser, context, url, timeout, warmup, samples, cache_modes):
+    """Warm-up loads, then `samples` measured loads per cache mode.
+
+    cold: every load in a brand-new context, so the HTTP cache starts empty
+    warm: loads in the pooled context, whose cache the warm-up loads primed
+    """
+    with timings.span('warmup'):
+        for _ in range(warmup):
+            await measure_load(context, url, timeout)
+
+    variants = {}
+    for mode in cache_modes:
+        measured = []
+        with timings.span(f'{mode}_samples'):
+            for _ in range(samples):
+                if mode == 'cold':
+                    cold_context = await browser.new_context(viewport=DESKTOP_VIEWPORT)
+                    try:
+                        measured.append(await measure_load(cold_context, url, timeout))
+                    finally:
+                        await cold_context.close()
+                else:
+                    measured.append(await measure_load(context, url, timeout))
+        variants[mode] = summarize_samples(measured)
+    return variants
+
+
+async def capture(store, key, page):
+    # Hashing and diffing run off the event loop so other captures keep going
+    with timings.span('screenshot'):
+        data = await page.screenshot(full_page=True)
+    with timings.span('screenshot_store'):
+        return await asyncio.to_thread(store.put, key, data)
+
+
+async def capture_viewport(browser, store, url, key, viewport, timeout):
+    """Load `url` at `viewport` in a fresh context; return (screenshot info, timing sample)."""
+    context = await browser.new_context(viewport=viewport)
+    try:
+        page, sample = await load_page(context, url, timeout)
+        return await capture(store, key, page), sample
+    finally:
+        await context.close()
+
+
+def screenshot_fields(info):
+    return {'screenshot': f'{STORE_DIR}/{info["path"]}', 'screenshot_change': info['change']}
 
-if __name__ == "__main__":
-    url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:3000"
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else "./ui-evaluation-results"
 
-    results = evaluate_ui(url, output_dir)
+def performance_fields(sample):
+    return {
+        'load_time': sample['load_time'],
+        'metrics': {k: sample[k] for k in ('domContentLoaded', 'domInteractive', 'firstPaint', 'firstContentfulPaint')},
+        'long_tasks': {'count': sample['long_task_count'], 'total_ms': sample['long_task_ms']},
+    }
+
+
+async def evaluate_page(context, url, store, timeout, sequential=False):
+    """Evaluate `url` in `context` and capture it at every viewport.
+
+    The responsive viewports load in parallel unless `sequential`, which keeps
+    their timings from contending with each other when budgets gate them.
+    """
+    page, sample = await load_page(context, url, timeout)
+    try:
+        with timings.span('page_metrics'):
+            data = await page.evaluate(PAGE_METRICS)
+
+        # Desktop from the evaluated page; each responsive viewport in its own context
+        slug = route_slug(url)
+        desktop_job = capture(store, f'{slug}/desktop', page)
+        viewport_jobs = (capture_viewport(context.browser, store, url, f'{slug}/{name}', viewport, timeout)
+                         for name, viewport in RESPONSIVE_VIEWPORTS.items())
+        with timings.span('screenshots'):
+            if sequential:
+                captures = [await desktop_job] + [await job for job in viewport_jobs]
+            else:
+                captures = await asyncio.gather(desktop_job, *viewport_jobs)
+        desktop = captures[0]
+        responsive = {
+            name: {
+                'viewport': viewport,
+                **screenshot_fields(info),
+                'cumulative_layout_shift': viewport_sample['cumulative_layout_shift'],
+                'performance': performance_fields(viewport_sample),
+            }
+            for (name, viewport), (info, viewport_sample) in zip(RESPONSIVE_VIEWPORTS.items(), captures[1:])
+        }
+
+        return {
+            'url': url,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'visual': {
+                **screenshot_fields(desktop),
+                'fonts_used': data['fonts_used'],
+                'cumulative_layout_shift': sample['cumulative_layout_shift'],
+            },
+            'performance': performance_fields(sample),
+            'functionality': data['functionality'],
+            'responsive': responsive,
+        }
+    finally:
+        await page.close()
+
+
+def apply_samples(result, variants, warmup, samples):
+    # Report every variant, and use the cold-cache medians as the run's headline numbers.
+    # The mode keeps them apart from single-load runs in the history
+    result['samples'] = {'warmup': warmup, 'measured': samples, **variants}
+    mode = 'cold' if 'cold' in variants else 'warm'
+    medians = {metric: stats['median'] for metric, stats in variants[mode].items()}
+    result['performance']['mode'] = mode
+    result['performance']['load_time'] = medians['load_time']
+    result['performance']['long_tasks'] = {'count': medians['long_task_count'], 'total_ms': medians['long_task_ms']}
+    for metric in result['performance']['metrics']:
+        if metric in medians:
+            result['performance']['metrics'][metric] = medians[metric]
+    result['visual']['cumulative_layout_shift'] = medians['cumulative_layout_shift']
+
+
+async def evaluate_batch(urls, output_dir, concurrency=4, timeout=30, sampling=None, phash_threshold=PHASH_THRESHOLD,
+                         sequential=False):
+    """Evaluate `urls` concurrently over `concurrency` reusable browser contexts.
+
+    `sampling` ({'warmup', 'samples', 'cache_modes'}) adds repeated-load statistics
+    per URL; `timeout` then applies to each page load rather than the whole URL.
+    Screenshots go to the content-addressed store under OUTPUT_DIR/screenshots.
+    `sequential` loads each URL's responsive viewports one at a time.
+    """
+    from playwright.async_api import async_playwright
+
+    store = ScreenshotStore(os.path.join(output_dir, STORE_DIR), phash_threshold)
+
+    async with async_playwright() as playwright:
+        with timings.span('browser_launch'):
+            browser = await playwright.chromium.launch()
+            pool = asyncio.Queue()
+            for _ in range(min(concurrency, len(urls))):
+                pool.put_nowait(await browser.new_context(viewport=DESKTOP_VIEWPORT))
+
+        loads = 1
+        if sampling:
+            loads += sampling['warmup'] + sampling['samples'] * len(sampling['cache_modes'])
+
+        async def evaluate(context, url):
+            variants = None
+            if sampling:
+                with timings.span('sampling'):
+                    variants = await sample_route(browser, context, url, timeout, **sampling)
+            with timings.span('evaluate'):
+                result = await evaluate_page(context, url, store, timeout, sequential)
+            if variants:
+                apply_samples(result, variants, sampling['warmup'], sampling['samples'])
+            return result
+
+        async def run(url):
+            context = await pool.get()
+            try:
+                return await asyncio.wait_for(evaluate(context, url), timeout * loads)
+            except asyncio.TimeoutError:
+                return {'url': url, 'error': f'Timed out after {timeout * loads}s'}
+            except Exception as e:
+                return {'url': url, 'error': str(e)}
+            finally:
+                pool.put_nowait(context)
+
+        try:
+            results = await asyncio.gather(*(run(url) for url in urls))
+        finally:
+            store.save()
+            await browser.close()
+
+    # Replaced baselines and the previous report's diffs; this run's report replaces that one
+    with timings.span('screenshot_prune'):
+        store.prune()
+    return results
+
+
+def run_batch(base_url, routes, output_dir, concurrency, timeout, sampling=None, phash_threshold=PHASH_THRESHOLD,
+              sequential=False):
+    urls = [route_url(base_url, route) for route in routes]
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    with timings.span('batch'):
+        results = asyncio.run(evaluate_batch(urls, output_dir, concurrency, timeout, sampling, phash_threshold,
+                                             sequential))
+    elapsed = round(time.perf_counter() - start, 2)
+
+    report = {
+        'base_url': base_url,
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'concurrency': concurrency,
+        'elapsed_seconds': elapsed,
+        'sampling': sampling,
+        'results': results,
+    }
+    report_path = os.path.join(output_dir, BATCH_REPORT)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    failed = [r for r in results if 'error' in r]
+    changed = [
+        capture for r in results if 'error' not in r
+        for capture in [r['visual'], *r['responsive'].values()]
+        if capture['screenshot_change']['status'] in ('new', 'changed')
+    ]
+    print(f'Evaluated {len(results)} URLs in {elapsed}s ({len(failed)} failed, {len(changed)} new or changed screenshots)')
+    for r in failed:
+        print(f'  {r["url"]}: {r["error"]}')
+    print(f'Report saved to: {report_path}')
+    return report
+
+
+def record_and_check(results, base_url, output_dir, history_path, budgets, window, accept=False):
+    """Append this run to the history and check it against the budgets.
+
+    Returns False when a budget is broken or, with budgets set, when any URL
+    failed: a page that couldn't be measured can't be shown to meet them.
+    With `accept` the run becomes the new baseline for relative budgets.
+    """
+    history_path = history_path or os.path.join(output_dir, ui_perf_history.HISTORY_FILE)
+    history = ui_perf_history.load_history(history_path)
+    entries = ui_perf_history.history_entries(results, base_url)
+    if accept:
+        for entry in entries:
+            entry['accepted'] = True
+    violations, pending = ui_perf_history.check_budgets(entries, history, budgets, window)
+    ui_perf_history.append_history(history_path, entries)
+    if not budgets:
+        return True
+
+    failed = [r for r in results if 'error' in r]
+    for r in failed:
+        print(f'BUDGET NOT CHECKED: {r["url"]} failed ({r["error"]})')
+    for v in violations:
+        print(f'BUDGET EXCEEDED {v["budget"]}: {v["route"]} [{v["viewport"]}, {v["mode"]}] '
+              f'{v["metric"]}={v["value"]} (limit {v["limit"]})')
+    for spec in budgets:
+        waiting = [p for p in pending if p['budget'] == spec]
+        if waiting:
+            print(f'Baseline not established yet for {spec}: {len(waiting)} route/viewport/mode series have fewer '
+                  f'than {ui_perf_history.MIN_BASELINE_RUNS} earlier clean runs '
+                  f'(most: {max(p["runs"] for p in waiting)}), not checked')
+    if accept:
+        print(f'Accepted {len(entries)} route/viewport/mode entries as the new baseline for relative budgets')
+    if violations or failed:
+        return False
+    print(f'All budgets met{" where a baseline exists" if pending else ""} ({", ".join(budgets)})')
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the UI evaluator against one URL or a batch of routes')
+    parser.add_argument('url', nargs='?', default=DEFAULT_URL, help='URL to evaluate, or base URL for --routes/--sitemap')
+    parser.add_argument('output_dir', nargs='?', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--routes', nargs='+', help='Routes to evaluate concurrently, relative to url')
+    parser.add_argument('--sitemap', help='Sitemap XML or text file with one route per line')
+    parser.add_argument('--concurrency', type=int, default=4, help='Browser contexts in the pool (default 4)')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='Per-URL timeout in seconds, per page load with --samples (default 30)')
+    parser.add_argument('--samples', type=int,
+                        help='Measured loads per URL and cache mode; reports min/median/p95/stdev')
+    parser.add_argument('--warmup', type=int, default=1, help='Discarded warm-up loads before --samples (default 1)')
+    parser.add_argument('--cache', choices=['cold', 'warm', 'both'], default='both',
+                        help='Measure with an empty HTTP cache, a primed one, or both (default both)')
+    parser.add_argument('--phash-threshold', type=int, default=PHASH_THRESHOLD,
+                        help=f'Perceptual hash distance (bits) before a screenshot is diffed (default {PHASH_THRESHOLD})')
+    parser.add_argument('--timing', help=f'Timing summary JSON (default OUTPUT_DIR/{TIMING_REPORT})')
+    parser.add_argument('--profile', choices=PROFILERS,
+                        help='Also dump a profile next to the timing summary (or set TOOL_PROFILE)')
+    parser.add_argument('--serve', metavar='DIR', help='Serve DIR on a local static server and use it as url')
+    parser.add_argument('--serve-port', type=int, default=0,
+                        help='Port for --serve (default: any free port)')
+    parser.add_argument('--history', help=f'Run history file (default OUTPUT_DIR/{ui_perf_history.HISTORY_FILE})')
+    parser.add_argument('--budget', action='append', default=[],
+                        help='Fail the run when exceeded, e.g. "FCP+20%%" or "CLS>0.1" (repeatable)')
+    parser.add_argument('--baseline-window', type=int, default=ui_perf_history.BASELINE_WINDOW,
+                        help=f'Previous runs per route, viewport and sampling mode in the baseline (default {ui_perf_history.BASELINE_WINDOW})')
+    parser.add_argument('--accept-baseline', action='store_true',
+                        help='Accept this run as the new baseline: relative budgets restart from it (absolute ones still apply)')
+    args = parser.parse_args()
+
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    if args.samples is not None and args.samples < 1:
+        parser.error('--samples must be at least 1')
+    if args.warmup < 0:
+        parser.error('--warmup must not be negative')
+    if args.sitemap:
+        try:
+            args.sitemap_routes = load_routes(args.sitemap)
+        except (OSError, ET.ParseError) as e:
+            parser.error(f'could not read --sitemap {args.sitemap}: {e}')
+        # An empty or misnamed sitemap would otherwise quietly evaluate just the base URL
+        if not args.sitemap_routes:
+            parser.error(f'--sitemap {args.sitemap} lists no routes')
+    for spec in args.budget:
+        try:
+            ui_perf_history.parse_budget(spec)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+
+def main():
+    args = parse_args()
+
+    routes = list(args.routes or [])
+    if args.sitemap:
+        routes += args.sitemap_routes
+
+    sampling = None
+    if args.samples:
+        cache_modes = ['cold', 'warm'] if args.cache == 'both' else [args.cache]
+        sampling = {'warmup': args.warmup, 'samples': args.samples, 'cache_modes': cache_modes}
+        # Sampling needs the pooled evaluator, so a single URL becomes a one-route batch
+        routes = routes or ['']
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timing_path = args.timing or os.path.join(args.output_dir, TIMING_REPORT)
+    with profiling(args.profile, os.path.splitext(timing_path)[0]) as profile_path:
+        passed = evaluate(args, routes, sampling)
+
+    summary = timings.write(timing_path)
+    print(f'Timing summary saved to: {timing_path} ({summary["wall_seconds"]}s)')
+    if profile_path:
+        print(f'Profile saved to: {profile_path}')
+    return 0 if passed else 1
+
+
+def evaluate(args, routes, sampling):
+    server = None
+    url = args.url
+    if args.serve:
+        server, url = serve_static(args.serve, args.serve_port)
+
+    try:
+        if routes:
+            # Budgeted responsive timings are taken one viewport at a time
+            results = run_batch(url, routes, args.output_dir, args.concurrency, args.timeout, sampling,
+                                args.phash_threshold, sequential=bool(args.budget))['results']
+        else:
+            from evaluate_ui import evaluate_ui
+
+            with timings.span('evaluate_ui'):
+                result = evaluate_ui(url, args.output_dir)
+            if not isinstance(result, dict):
+                with open(os.path.join(args.output_dir, 'evaluation-results.json'), 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+            results = [result]
+            # A single URL is keyed on its own path
+            url = urljoin(url, '/')
+    finally:
+        if server:
+            server.shutdown()
+
+    with timings.span('history'):
+        return record_and_check(results, url, args.output_dir, args.history, args.budget, args.baseline_window,
+                                args.accept_baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
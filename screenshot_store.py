@@ -0,0 +1,170 @@
+"""
+Content-addressed screenshot store for the UI evaluator
+
+Screenshots are stored once under objects/<sha256>.png, so an unchanged page
+costs no extra disk writes. manifest.json maps each capture key (route and
+viewport) to its baseline: the last capture that was new or diffed as changed.
+
+A capture whose bytes differ from the baseline is compared on a difference hash
+(layout and edges) and a 16x16 colour thumbnail (fills, backgrounds, themes,
+which the hash can't see). If either moved past its threshold it is 'changed',
+gets a full pixel diff and becomes the baseline; otherwise it is 'similar' and
+the baseline stays put, so small changes can't creep in one run at a time.
+Similar captures aren't written: they report the baseline's path instead.
+
+prune() deletes objects that neither the manifest nor the current run refers
+to, such as replaced baselines and the previous run's diffs.
+
+Perceptual hashing and diffs need Pillow; without it captures are still
+deduplicated by content hash.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+
+try:
+    from PIL import Image, ImageChops
+except ImportError:
+    Image = None
+
+STORE_DIR = 'screenshots'
+MANIFEST = 'manifest.json'
+# Hamming distance (out of 64 bits) below which two captures count as the same picture
+PHASH_THRESHOLD = 4
+# Per-channel difference below which a pixel isn't counted as changed (compression noise)
+PIXEL_TOLERANCE = 16
+# Thumbnail edge in pixels; each cell averages a block of the page
+THUMBNAIL_SIZE = 16
+
+
+def dhash(image):
+    """64-bit difference hash of a PIL image, as 16 hex digits."""
+    small = image.convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{bits:016x}'
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def thumbnail(image):
+    """THUMBNAIL_SIZE x THUMBNAIL_SIZE block-averaged RGB pixels of a PIL image, as hex."""
+    return image.convert('RGB').resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BOX).tobytes().hex()
+
+
+def thumbnail_delta(a, b):
+    """Largest per-channel difference between two thumbnails (0-255)."""
+    return max(abs(x - y) for x, y in zip(bytes.fromhex(a), bytes.fromhex(b)))
+
+
+class ScreenshotStore:
+    def __init__(self, root, phash_threshold=PHASH_THRESHOLD):
+        self.root = root
+        self.phash_threshold = phash_threshold
+        self.manifest_path = os.path.join(root, MANIFEST)
+        self.lock = threading.Lock()
+        # Objects handed out since the store was opened (captures and diffs in this run's report)
+        self.used = set()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    def _write_object(self, data, sha=None):
+        sha = sha or hashlib.sha256(data).hexdigest()
+        rel = f'objects/{sha}.png'
+        path = os.path.join(self.root, rel)
+        if not os.path.exists(path):
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        with self.lock:
+            self.used.add(rel)
+        return sha, rel
+
+    def _pixel_diff(self, previous_rel, image):
+        with Image.open(os.path.join(self.root, previous_rel)) as previous:
+            previous = previous.convert('RGB')
+        current = image.convert('RGB')
+        if previous.size != current.size:
+            return {'changed_ratio': 1.0, 'previous_size': list(previous.size), 'size': list(current.size)}
+
+        mask = ImageChops.difference(previous, current).convert('L').point(
+            lambda v: 255 if v > PIXEL_TOLERANCE else 0)
+        changed = mask.histogram()[255]
+        buffer = io.BytesIO()
+        mask.save(buffer, format='PNG')
+        _, diff_rel = self._write_object(buffer.getvalue())
+        return {
+            'changed_pixels': changed,
+            'changed_ratio': round(changed / (current.width * current.height), 6),
+            'bbox': list(mask.getbbox() or []),
+            'diff': diff_rel,
+        }
+
+    def put(self, key, data):
+        """Store PNG bytes captured for `key`; return where they live and how they
+        changed from the baseline, which moves to this capture unless it is 'similar'."""
+        sha = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            previous = self.manifest.get(key)
+
+        entry = {'sha256': sha, 'path': f'objects/{sha}.png', 'phash': None, 'thumbnail': None}
+        change = {'status': 'new'} if previous is None else {'status': 'unchanged'}
+
+        if Image is not None:
+            with Image.open(io.BytesIO(data)) as image:
+                entry['phash'] = dhash(image)
+                entry['thumbnail'] = thumbnail(image)
+                if previous and previous['sha256'] != sha:
+                    # Entries from before thumbnails (or Pillow) count as fully moved
+                    distance = hamming(previous['phash'], entry['phash']) if previous.get('phash') else 64
+                    delta = thumbnail_delta(previous['thumbnail'], entry['thumbnail']) if previous.get('thumbnail') else 255
+                    change = {'status': 'similar', 'phash_distance': distance, 'thumbnail_delta': delta,
+                              'baseline': previous['path']}
+                    if distance > self.phash_threshold or delta > PIXEL_TOLERANCE:
+                        change = {'status': 'changed', 'phash_distance': distance, 'thumbnail_delta': delta,
+                                  **self._pixel_diff(previous['path'], image)}
+        elif previous and previous['sha256'] != sha:
+            change = {'status': 'changed'}
+
+        if change['status'] == 'similar':
+            with self.lock:
+                self.used.add(previous['path'])
+            return {**entry, 'path': previous['path'], 'change': change}
+
+        self._write_object(data, sha)
+        if change['status'] in ('new', 'changed'):
+            with self.lock:
+                self.manifest[key] = entry
+        return {**entry, 'change': change}
+
+    def prune(self):
+        """Delete objects not referenced by the manifest or used since the store
+        was opened; returns the removed paths relative to the store root."""
+        with self.lock:
+            keep = self.used | {entry['path'] for entry in self.manifest.values()}
+        removed = []
+        for name in sorted(os.listdir(os.path.join(self.root, 'objects'))):
+            rel = f'objects/{name}'
+            if rel not in keep:
+                os.remove(os.path.join(self.root, rel))
+                removed.append(rel)
+        return removed
+
+    def save(self):
+        with self.lock:
+            tmp = f'{self.manifest_path}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.manifest_path)
@@ -0,0 +1,18 @@
+# The Python tooling lives as flat scripts and modules in the repo root
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def analyze_excel():
+    # analyze-excel.py isn't importable by name
+    spec = importlib.util.spec_from_file_location('analyze_excel', os.path.join(ROOT, 'analyze-excel.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
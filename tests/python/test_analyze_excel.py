@@ -0,0 +1,98 @@
+import pytest
+
+openpyxl = pytest.importorskip('openpyxl')
+
+COLUMNS = ['Association Name', 'Location', 'League Name']
+
+
+def workbook(path, rows):
+    # Title row above the header, like the Ontario list
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.append(['Ontario Associations'])
+    sheet.append(COLUMNS)
+    for row in rows:
+        sheet.append(row)
+    wb.save(path)
+    return str(path)
+
+
+def test_stream_and_whole_sheet_count_the_same_rows(tmp_path, analyze_excel):
+    path = workbook(tmp_path / 'list.xlsx', [
+        ['Aurora MHA', 'Aurora', 'OMHA'],
+        [None, None, None],
+        ['Barrie MHA', 'Barrie', None],
+        [None, None, None, 'note'],
+        ['Clarington MHA', None, None],
+        [None, None, None],
+        [None, None, None],
+    ])
+    whole = analyze_excel.load_associations(path)
+    for chunk_size in (1, 2, 100):
+        chunks = list(analyze_excel.iter_association_chunks(path, chunk_size))
+        assert sum(len(chunk) for chunk in chunks) == len(whole) == 5
+        streamed = [analyze_excel.find_new_associations(chunk, set()) for chunk in chunks]
+        assert [a for new in streamed for a in new] == analyze_excel.find_new_associations(whole, set())
+
+
+def test_index_keys_match_normalized_sheet_names(tmp_path, analyze_excel, monkeypatch):
+    (tmp_path / 'batch-1-results.json').write_text(
+        '[{"association": "Aurora Minor Hockey Association"}, {"name": "Barrie Girls Only MHA"}]')
+    patterns = [str(tmp_path / pattern) for pattern in analyze_excel.RESULT_PATTERNS]
+    db_path = str(tmp_path / 'index.sqlite')
+
+    conn, stats = analyze_excel.update_index(db_path, patterns)
+    keys = analyze_excel.indexed_names(conn)
+    conn.close()
+    assert stats['updated'] == 1 and not stats['rekeyed']
+    assert keys == {'aurora', 'barrie'}
+
+    sheet = analyze_excel.pd.DataFrame({
+        'Association Name': ['Aurora MHA', 'Girls Only Barrie Hockey Association', 'Clarington'],
+        'Location': ['Aurora', 'Barrie', 'Courtice'],
+        'League Name': ['OMHA'] * 3,
+    })
+    new = analyze_excel.find_new_associations(sheet, keys, analyze_excel.normalize_key)
+    assert [a['name'] for a in new] == ['Clarington']
+
+    # Unchanged files are skipped, unless the keys were made by another normalize_key()
+    conn, stats = analyze_excel.update_index(db_path, patterns)
+    conn.close()
+    assert stats['updated'] == 0
+    monkeypatch.setattr(analyze_excel, 'KEY_VERSION', analyze_excel.KEY_VERSION + 1)
+    conn, stats = analyze_excel.update_index(db_path, patterns)
+    conn.close()
+    assert stats['rekeyed'] and stats['updated'] == 1
+
+
+def test_fuzzy_threshold_below_the_floor(analyze_excel):
+    new = [{'name': 'Almaguin Gazelles', 'location': 'Burk\'s Falls', 'league': 'OMHA'}]
+    kept, pairs = analyze_excel.fuzzy_filter(new, {'almaguin ice devils'}, threshold=0.4)
+    assert kept == []
+    assert pairs[0]['matched'] == 'almaguin ice devils' and pairs[0]['skipped']
+
+    kept, pairs = analyze_excel.fuzzy_filter(new, {'almaguin ice devils'})
+    assert kept == new and pairs == []
+
+
+@pytest.mark.parametrize('floor', [0.4, 0.6, 0.85])
+def test_index_matches_the_per_name_scorer(analyze_excel, floor):
+    names, extracted_names = analyze_excel.synthetic_fuzzy_names(2000, seed=3)
+    index = analyze_excel.NgramIndex(sorted(extracted_names), floor)
+    assert index.best_matches(names) == analyze_excel.best_matches_loop(names, extracted_names, floor)
+
+
+@pytest.mark.parametrize('suffix', ['.arrow', '.parquet'])
+def test_consolidated_tables_match_on_normalized_keys(tmp_path, analyze_excel, suffix):
+    pa = pytest.importorskip('pyarrow')
+    table = pa.table({'key': ['aurora', 'barrie'], 'association': ['Aurora MHA', 'Barrie Minor Hockey']})
+    path = str(tmp_path / f'extraction-results{suffix}')
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, path, compression='uncompressed')
+
+    assert analyze_excel.load_extracted_names(path) == {'aurora', 'barrie'}
+    assert analyze_excel.match_key_for(path) is analyze_excel.normalize_key
@@ -0,0 +1,115 @@
+import random
+import string
+
+import pytest
+
+pytest.importorskip('numpy')
+import association_keys
+from association_keys import NgramIndex, normalize_key
+
+FLOORS = [0.3, 0.5, 0.6, 0.85, 1.0]
+
+
+def regex_key(name):
+    # normalize_key() before its ASCII fast path
+    key = str(name).lower().split('|')[0]
+    key = key.replace('&', ' and ')
+    key = association_keys._GIRLS_RE.sub(' ', key)
+    key = association_keys._PUNCT_RE.sub(' ', key).strip()
+    return association_keys._SUFFIX_RE.sub('', key) or key
+
+
+def brute_force(names, indexed_names, floor, n=3):
+    # Dice over padded n-gram sets against every distinct key; ties go to the earliest name
+    def grams(key):
+        padded = f' {key} '
+        return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+    indexed, seen = [], set()
+    for name in indexed_names:
+        key = normalize_key(name)
+        if key and key not in seen:
+            seen.add(key)
+            indexed.append((name, grams(key)))
+
+    matches = []
+    for name in names:
+        query = grams(normalize_key(name))
+        best = (None, 0.0)
+        for indexed_name, other in indexed:
+            score = 2 * len(query & other) / (len(query) + len(other))
+            if score >= floor and score > best[1]:
+                best = (indexed_name, score)
+        matches.append(best)
+    return matches
+
+
+def random_name(rng):
+    alphabet = string.ascii_lowercase + '  -&.\'éüßçÉ中😀'
+    stem = ''.join(rng.choices(alphabet, k=rng.randint(0, 14)))
+    return stem + rng.choice(['', ' MHA', ' Minor Hockey Association', ' Girls Only', ' Inc.', ' Hockey Club'])
+
+
+def test_normalize_key():
+    assert normalize_key('Aurora Minor Hockey Association') == 'aurora'
+    assert normalize_key('Girls Only Barrie Hockey Association') == 'barrie'
+    assert normalize_key('St. Mary\'s & District MHA Inc.') == 'st mary s and district'
+    # Never stripped down to nothing
+    assert normalize_key('Hockey Association') == 'hockey'
+    assert normalize_key('Association') == 'association'
+    assert normalize_key('Québec Minor Hockey') == 'qu bec'
+    assert normalize_key('Ajax | Pickering') == 'ajax'
+
+
+def test_normalize_key_fast_path_matches_regexes():
+    rng = random.Random(0)
+    words = association_keys.SUFFIXES + ['minor', 'hockey', 'girls only', 'girl', 'club', 'x', 'assoc.']
+    alphabet = string.ascii_letters + string.digits + ' -&|.,\'()/\t'
+    for _ in range(20000):
+        name = ''.join(rng.choices(alphabet, k=rng.randint(0, 16))) + ' ' + ' '.join(
+            rng.choices(words, k=rng.randint(0, 4))) + rng.choice(['', '.', ' ', ' Inc.', '!!'])
+        assert normalize_key(name) == regex_key(name), name
+
+
+@pytest.mark.parametrize('floor', FLOORS)
+def test_best_matches_agree_with_brute_force(floor):
+    rng = random.Random(int(floor * 100))
+    for _ in range(40):
+        indexed_names = [random_name(rng) for _ in range(rng.randint(0, 50))]
+        names = [random_name(rng) for _ in range(rng.randint(0, 50))] + [n.upper() for n in indexed_names[:5]]
+        index = NgramIndex(indexed_names, floor)
+        expected = brute_force(names, indexed_names, floor)
+        for batch_size in (1, 7, association_keys.QUERY_BATCH):
+            assert index.best_matches(names, batch_size) == expected
+
+
+@pytest.mark.parametrize('floor', FLOORS)
+def test_edge_cases(floor):
+    assert NgramIndex([], floor).best_matches(['Aurora']) == [(None, 0.0)]
+    assert NgramIndex(['Aurora'], floor).best_matches([]) == []
+
+    # Names too short for a trigram, or normalized to nothing
+    indexed_names = ['a', 'ab', '!!!', 'abc', 'Ab MHA', '中', '😀😀']
+    names = ['', 'a', 'AB', '???', 'abc', 'abd', '中', '😀😀', '😀']
+    assert NgramIndex(indexed_names, floor).best_matches(names) == brute_force(names, indexed_names, floor)
+
+
+def test_ties_go_to_the_earliest_name():
+    # 'abcd' shares 2 of its 4 trigrams with each name, which all score 0.5
+    index = NgramIndex(['abcx', 'abcy', 'abcz'], 0.3)
+    assert index.best_match('abcd') == ('abcx', 0.5)
+    index = NgramIndex(['abcz', 'abcy', 'abcx'], 0.3)
+    assert index.best_match('abcd') == ('abcz', 0.5)
+
+    # Names with the same key are indexed once, under the first of them
+    index = NgramIndex(['Aurora MHA', 'Aurora Minor Hockey'], 0.6)
+    assert index.best_match('aurora') == ('Aurora MHA', 1.0)
+
+
+def test_unicode_names():
+    # Only a-z and 0-9 survive normalize_key(): accents split words, and names
+    # without any of them have no key and aren't indexed
+    index = NgramIndex(['Québec Remparts', '中文', '😀'], 0.5)
+    assert index.names == ['Québec Remparts']
+    assert index.best_match('Quebec Remparts')[0] == 'Québec Remparts'
+    assert index.best_match('中文') == (None, 0.0)
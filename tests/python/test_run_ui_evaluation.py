@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip('PIL')
+from run_ui_evaluation import load_routes, route_url
+
+SITEMAP = '''<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url><loc>https://example.com/</loc></url>
+  <url>
+    <loc>https://example.com/budget?year=2025</loc>
+    <image:image><image:loc>https://example.com/chart.png</image:loc></image:image>
+  </url>
+</urlset>
+'''
+
+
+def test_absolute_locs_are_rebased_onto_the_base_url():
+    base = 'http://127.0.0.1:8000/'
+    assert route_url(base, 'https://example.com/budget?year=2025') == 'http://127.0.0.1:8000/budget?year=2025'
+    assert route_url(base, 'https://example.com') == 'http://127.0.0.1:8000/'
+    assert route_url(base, '/dashboard') == 'http://127.0.0.1:8000/dashboard'
+    assert route_url('http://localhost:3000/app/', 'approvals') == 'http://localhost:3000/app/approvals'
+
+
+def test_sitemap_page_locations(tmp_path):
+    path = tmp_path / 'sitemap.xml'
+    path.write_text(SITEMAP, encoding='utf-8')
+    assert load_routes(str(path)) == ['https://example.com/', 'https://example.com/budget?year=2025']
+
+
+def test_sitemap_index_is_followed(tmp_path):
+    (tmp_path / 'sitemap-0.xml').write_text(SITEMAP, encoding='utf-8')
+    (tmp_path / 'sitemap.xml').write_text(
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        '<sitemap><loc>https://example.com/sitemap-0.xml</loc></sitemap></sitemapindex>', encoding='utf-8')
+    assert load_routes(str(tmp_path / 'sitemap.xml')) == ['https://example.com/', 'https://example.com/budget?year=2025']
+
+
+def test_text_routes(tmp_path):
+    path = tmp_path / 'routes.txt'
+    path.write_text('# smoke routes\n/\n\n/approvals\n', encoding='utf-8')
+    assert load_routes(str(path)) == ['/', '/approvals']
@@ -0,0 +1,104 @@
+import io
+import os
+
+import pytest
+
+PIL = pytest.importorskip('PIL')
+from PIL import Image, ImageDraw
+
+from screenshot_store import ScreenshotStore
+
+
+def page(background, text='#333333', size=(320, 480), marker=None):
+    # A page-like PNG: flat background, a few text bars unless text is None, an optional small mark
+    image = Image.new('RGB', size, background)
+    draw = ImageDraw.Draw(image)
+    for y in range(40, size[1] - 40, 60) if text else ():
+        draw.rectangle((20, y, size[0] - 60, y + 12), fill=text)
+    if marker:
+        draw.rectangle((size[0] - 30, 10, size[0] - 28, 12), fill=marker)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_identical_capture_is_unchanged(tmp_path):
+    store = ScreenshotStore(str(tmp_path))
+    assert store.put('home/desktop', page('white'))['change']['status'] == 'new'
+    assert store.put('home/desktop', page('white'))['change']['status'] == 'unchanged'
+
+
+def test_colour_change_is_changed(tmp_path):
+    # dHash only sees gradients, so a flat page going white -> black hashes the same
+    store = ScreenshotStore(str(tmp_path))
+    store.put('home/desktop', page('white', text=None))
+    change = store.put('home/desktop', page('black', text=None))['change']
+
+    assert change['phash_distance'] == 0
+    assert change['status'] == 'changed'
+    assert change['changed_ratio'] == 1.0
+    assert change['diff']
+
+
+def test_theme_change_is_changed(tmp_path):
+    # Same layout and contrast direction, darker theme
+    store = ScreenshotStore(str(tmp_path))
+    store.put('home/desktop', page('#ffffff', text='#555555'))
+    change = store.put('home/desktop', page('#444444', text='#000000'))['change']
+
+    assert change['status'] == 'changed'
+    assert change['changed_ratio'] > 0.5
+
+
+def test_similar_capture_keeps_the_baseline(tmp_path):
+    store = ScreenshotStore(str(tmp_path))
+    baseline = store.put('home/desktop', page('white'))
+    similar = store.put('home/desktop', page('white', marker='#ff0000'))
+
+    assert similar['change']['status'] == 'similar'
+    assert similar['change']['baseline'] == baseline['path']
+    assert store.manifest['home/desktop']['path'] == baseline['path']
+    # Not written: the report points at the baseline
+    assert similar['path'] == baseline['path']
+    assert sorted(os.listdir(tmp_path / 'objects')) == [os.path.basename(baseline['path'])]
+
+
+def test_gradual_drift_is_caught(tmp_path):
+    # Each step is within tolerance of the one before, but not of the baseline
+    store = ScreenshotStore(str(tmp_path))
+    store.put('home/desktop', page((250, 250, 250), text=None))
+    statuses = [store.put('home/desktop', page((level, level, level), text=None))['change']['status']
+                for level in (240, 230, 220)]
+
+    # 230 is 20 away from 250 and becomes the baseline; 220 is then only 10 away
+    assert statuses == ['similar', 'changed', 'similar']
+
+
+def test_manifest_round_trips(tmp_path):
+    store = ScreenshotStore(str(tmp_path))
+    first = store.put('home/mobile', page('white'))
+    store.save()
+
+    reopened = ScreenshotStore(str(tmp_path))
+    assert reopened.manifest['home/mobile']['sha256'] == first['sha256']
+    assert reopened.put('home/mobile', page('white'))['change']['status'] == 'unchanged'
+
+
+def test_prune_keeps_baselines_and_this_runs_objects(tmp_path):
+    store = ScreenshotStore(str(tmp_path))
+    replaced = store.put('home/desktop', page('white', text=None))
+    store.put('about/desktop', page('white'))
+    store.save()
+
+    # Next run: home changes and replaces its baseline, about isn't captured
+    store = ScreenshotStore(str(tmp_path))
+    changed = store.put('home/desktop', page('black', text=None))
+    assert store.prune() == [replaced['path']]
+    kept = {changed['path'], changed['change']['diff'], store.manifest['about/desktop']['path']}
+    assert {f'objects/{name}' for name in os.listdir(tmp_path / 'objects')} == kept
+
+    # The run after that only needs the baselines
+    store.save()
+    store = ScreenshotStore(str(tmp_path))
+    store.put('home/desktop', page('black', text=None))
+    assert store.prune() == [changed['change']['diff']]
@@ -0,0 +1,105 @@
+import pytest
+
+from ui_perf_history import MIN_BASELINE_RUNS, baseline, check_budgets, history_entries, parse_budget
+
+
+def entry(fcp, cls=0.0, route='/', viewport='desktop', mode='single', **extra):
+    return {'route': route, 'viewport': viewport, 'mode': mode,
+            'metrics': {'firstContentfulPaint': fcp, 'cumulative_layout_shift': cls}, **extra}
+
+
+def test_parse_budget():
+    assert parse_budget('FCP+20%') == ('firstContentfulPaint', 'relative', 0.2)
+    assert parse_budget(' cls > 0.1 ') == ('cumulative_layout_shift', 'absolute', 0.1)
+    assert parse_budget('load_time+5%') == ('load_time', 'relative', 0.05)
+    for spec in ('FCP', 'FCP<100', 'TTI+10%', 'FCP+%'):
+        with pytest.raises(ValueError):
+            parse_budget(spec)
+
+
+def test_baseline_median_and_p90():
+    history = [entry(fcp) for fcp in (100, 110, 120, 130, 1000)]
+    base = baseline(history, '/', 'desktop', 'single', 'firstContentfulPaint')
+    assert base['runs'] == 5 and base['median'] == 120
+    assert baseline(history, '/', 'desktop', 'single', 'firstContentfulPaint', window=2)['median'] == 565
+    assert baseline(history, '/other', 'desktop', 'single', 'firstContentfulPaint') is None
+
+
+def test_baseline_is_keyed_on_viewport_and_mode():
+    # Entries from before modes were recorded are single loads
+    legacy = entry(90)
+    del legacy['mode']
+    history = [entry(100), entry(500, viewport='mobile'), entry(50, mode='cold'), legacy]
+    assert baseline(history, '/', 'desktop', 'single', 'firstContentfulPaint')['median'] == 95
+    assert baseline(history, '/', 'mobile', 'single', 'firstContentfulPaint')['median'] == 500
+    assert baseline(history, '/', 'desktop', 'cold', 'firstContentfulPaint')['median'] == 50
+
+
+def test_relative_budget_is_pending_without_enough_history():
+    history = [entry(100)] * (MIN_BASELINE_RUNS - 1)
+    violations, pending = check_budgets([entry(1000)], history, ['FCP+20%'])
+    assert violations == []
+    assert pending == [{'route': '/', 'viewport': 'desktop', 'mode': 'single', 'budget': 'FCP+20%',
+                        'runs': MIN_BASELINE_RUNS - 1}]
+
+
+def test_relative_budget():
+    history = [entry(fcp) for fcp in (100, 100, 102, 98, 100)]
+    ok, slow = entry(115), entry(130)
+    violations, pending = check_budgets([ok, slow], history, ['FCP+20%'])
+    assert pending == []
+    assert [v['value'] for v in violations] == [130]
+    assert violations[0]['limit'] == 120
+    assert slow['violations'] == ['FCP+20%'] and 'violations' not in ok
+
+
+def test_relative_budget_needs_to_clear_the_spread():
+    # 20% over the median but within the runs' own p90
+    history = [entry(fcp) for fcp in (100, 100, 100, 200, 200, 200)]
+    assert check_budgets([entry(190)], history, ['FCP+20%'])[0] == []
+
+
+def test_absolute_budget():
+    violations, pending = check_budgets([entry(100, cls=0.25), entry(100, cls=0.05)], [], ['CLS>0.1'])
+    assert pending == []
+    assert [(v['metric'], v['value'], v['limit']) for v in violations] == [('cumulative_layout_shift', 0.25, 0.1)]
+
+
+def test_violation_only_drops_the_broken_metric_from_baselines():
+    history = [entry(100, cls=0.5, violations=['CLS>0.1'])] * MIN_BASELINE_RUNS + [entry(100, cls=0.01)]
+    assert baseline(history, '/', 'desktop', 'single', 'firstContentfulPaint')['runs'] == MIN_BASELINE_RUNS + 1
+    assert baseline(history, '/', 'desktop', 'single', 'cumulative_layout_shift')['runs'] == 1
+
+    # A relative regression stays out of its own baseline
+    history = [entry(100)] * MIN_BASELINE_RUNS + [entry(300, violations=['FCP+20%'])] * 10
+    assert check_budgets([entry(300)], history, ['FCP+20%'])[0]
+
+
+def test_accepted_run_resets_the_baseline():
+    history = [entry(100)] * MIN_BASELINE_RUNS
+    accepted = entry(300, accepted=True)
+    assert check_budgets([accepted], history, ['FCP+20%']) == ([], [])
+    assert 'violations' not in accepted
+
+    history.append(accepted)
+    assert baseline(history, '/', 'desktop', 'single', 'firstContentfulPaint') == {'runs': 1, 'median': 300, 'p90': 300}
+    history += [entry(300)] * (MIN_BASELINE_RUNS - 1)
+    assert check_budgets([entry(310)], history, ['FCP+20%']) == ([], [])
+
+    # Absolute ceilings still apply to an accepted run
+    assert check_budgets([entry(100, cls=0.3, accepted=True)], history, ['CLS>0.1'])[0]
+
+
+def test_history_entries():
+    results = [
+        {'url': 'http://127.0.0.1:5000/budget', 'performance': {'load_time': 900, 'metrics': {'firstContentfulPaint': 300}, 'mode': 'cold'},
+         'visual': {'cumulative_layout_shift': 0.01},
+         'responsive': {'mobile': {'cumulative_layout_shift': 0.2, 'performance': {'load_time': 1200, 'metrics': {}}},
+                        'tablet': {'screenshot': 'x.png'}}},
+        {'url': 'http://127.0.0.1:5000/broken', 'error': 'Timed out'},
+    ]
+    entries = history_entries(results, 'http://127.0.0.1:5000/')
+    assert [(e['route'], e['viewport'], e['mode'], e['metrics']) for e in entries] == [
+        ('/budget', 'desktop', 'cold', {'load_time': 900, 'firstContentfulPaint': 300, 'cumulative_layout_shift': 0.01}),
+        ('/budget', 'mobile', 'single', {'load_time': 1200, 'cumulative_layout_shift': 0.2}),
+    ]
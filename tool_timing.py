@@ -0,0 +1,131 @@
+"""
+Timing instrumentation shared by the Python tooling scripts
+
+Timings.span() nests phases: a span opened inside another is recorded under
+"outer/inner". The current span is tracked per asyncio task / thread, so
+concurrent work (e.g. one page per browser context) nests correctly; spans of
+the same path are aggregated into count / total / max, and totals of spans that
+ran concurrently can exceed the wall time.
+
+Set TOOL_PROFILE=cprofile (or pyinstrument) or pass --profile to also dump a
+profile next to the timing summary.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_ENV = 'TOOL_PROFILE'
+PROFILERS = ['cprofile', 'pyinstrument']
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process, or None where it can't be measured
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+
+
+class Timings:
+    def __init__(self, tool):
+        self.tool = tool
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.lock = threading.Lock()
+        self._path = contextvars.ContextVar(f'{tool}_span', default=())
+
+    @contextmanager
+    def span(self, name):
+        path = self._path.get() + (name,)
+        token = self._path.set(path)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._path.reset(token)
+            key = '/'.join(path)
+            with self.lock:
+                stats = self.spans.setdefault(key, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+                stats['count'] += 1
+                stats['total_seconds'] += elapsed
+                stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+    def summary(self):
+        peak = peak_rss_mb()
+        return {
+            'tool': self.tool,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'wall_seconds': round(time.perf_counter() - self.started, 4),
+            'peak_rss_mb': round(peak, 1) if peak is not None else None,
+            'spans': [
+                {
+                    'path': key,
+                    'depth': key.count('/'),
+                    'count': stats['count'],
+                    'total_seconds': round(stats['total_seconds'], 4),
+                    'max_seconds': round(stats['max_seconds'], 4),
+                }
+                for key, stats in sorted(self.spans.items())
+            ],
+        }
+
+    def write(self, path):
+        summary = self.summary()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+@contextmanager
+def profiling(mode, output_prefix):
+    """Profile the block with cProfile or pyinstrument; mode None falls back to $TOOL_PROFILE."""
+    mode = (mode or os.environ.get(PROFILE_ENV) or '').lower()
+    if not mode:
+        yield None
+        return
+    if mode not in PROFILERS:
+        raise ValueError(f'Unknown profiler {mode!r}, expected one of {PROFILERS}')
+
+    if mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print('pyinstrument is not installed, using cProfile', file=sys.stderr)
+            mode = 'cprofile'
+
+    if mode == 'pyinstrument':
+        profiler = Profiler(async_mode='enabled')
+        profiler.start()
+        try:
+            yield f'{output_prefix}.html'
+        finally:
+            profiler.stop()
+            with open(f'{output_prefix}.html', 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield f'{output_prefix}.prof'
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f'{output_prefix}.prof')
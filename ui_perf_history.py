@@ -0,0 +1,170 @@
+"""
+Append-only performance history and regression budgets for the UI evaluator
+
+Every evaluated page adds one JSON line per viewport to the history file, keyed
+by its route relative to the base URL, so runs against another host or port
+(e.g. --serve on a free port) share one history. Budgets are checked against a
+rolling baseline built from the previous runs of the same route, viewport and
+sampling mode (single load, or cold/warm-cache medians with --samples):
+
+  FCP+20%   relative: the median of recent runs plus 20%, and also above their p90
+  CLS>0.1   absolute: a hard ceiling regardless of history
+
+Entries that break a budget are flagged with the budgets they broke, and their
+value for that metric is left out of later baselines so a regression doesn't
+become the new normal; their other metrics still count. When a slower level is
+intended, accept the run (--accept-baseline): its entries are marked accepted,
+relative budgets aren't checked against them, and each series' baseline
+restarts from its latest accepted run.
+"""
+import json
+import os
+import re
+import statistics
+import time
+from urllib.parse import urlparse
+
+HISTORY_FILE = 'perf-history.jsonl'
+BASELINE_WINDOW = 20
+# Relative budgets are only enforced once there are this many earlier clean runs
+MIN_BASELINE_RUNS = 5
+
+METRIC_ALIASES = {
+    'LOAD': 'load_time',
+    'DCL': 'domContentLoaded',
+    'DI': 'domInteractive',
+    'FP': 'firstPaint',
+    'FCP': 'firstContentfulPaint',
+    'CLS': 'cumulative_layout_shift',
+}
+METRICS = list(METRIC_ALIASES.values())
+
+_BUDGET_RE = re.compile(r'^\s*(\w+)\s*(?:\+\s*([\d.]+)\s*%|>\s*([\d.]+))\s*$')
+
+
+def extract_metrics(result):
+    """Flatten one evaluation-results.json style result into {metric: value}."""
+    performance = result.get('performance') or {}
+    metrics = dict(performance.get('metrics') or {})
+    metrics['load_time'] = performance.get('load_time')
+    metrics['cumulative_layout_shift'] = (result.get('visual') or {}).get('cumulative_layout_shift')
+    return {name: metrics[name] for name in METRICS if metrics.get(name) is not None}
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(path, entries):
+    with open(path, 'a', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+
+
+def route_path(url, base_url):
+    """'http://127.0.0.1:41234/budget?x=1' under 'http://127.0.0.1:41234/' -> '/budget?x=1'"""
+    if url.startswith(base_url):
+        rest = url[len(base_url):]
+    else:
+        parts = urlparse(url)
+        rest = parts.path + (f'?{parts.query}' if parts.query else '')
+    return '/' + rest.lstrip('/')
+
+
+def history_entries(results, base_url):
+    """One entry per evaluated page and viewport; failed pages have no numbers to record."""
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+    entries = []
+    for r in results:
+        if 'error' in r:
+            continue
+        # Responsive viewports carry their own load timings next to their screenshot
+        views = {'desktop': r}
+        for name, view in (r.get('responsive') or {}).items():
+            if 'performance' in view:
+                views[name] = {'performance': view['performance'], 'visual': view}
+        for viewport, view in views.items():
+            entries.append({'timestamp': timestamp, 'route': route_path(r['url'], base_url), 'url': r['url'],
+                            'viewport': viewport, 'mode': view['performance'].get('mode', 'single'),
+                            'metrics': extract_metrics(view)})
+    return entries
+
+
+def violated_metrics(entry):
+    return {parse_budget(spec)[0] for spec in entry.get('violations', ())}
+
+
+def baseline(history, route, viewport, mode, metric, window=BASELINE_WINDOW):
+    """Median and p90 of `metric` over the last `window` clean runs since the
+    latest accepted one, or None without history."""
+    series = [
+        e for e in history
+        if e.get('route') == route and e['viewport'] == viewport and e.get('mode', 'single') == mode
+    ]
+    accepted = [i for i, e in enumerate(series) if e.get('accepted')]
+    if accepted:
+        series = series[accepted[-1]:]
+    values = [
+        e['metrics'][metric] for e in series
+        if metric in e['metrics'] and metric not in violated_metrics(e)
+    ][-window:]
+    if not values:
+        return None
+    p90 = statistics.quantiles(values, n=10, method='inclusive')[8] if len(values) > 1 else values[0]
+    return {'runs': len(values), 'median': statistics.median(values), 'p90': p90}
+
+
+def parse_budget(spec):
+    """'FCP+20%' -> ('firstContentfulPaint', 'relative', 0.2); 'CLS>0.1' -> (..., 'absolute', 0.1)"""
+    match = _BUDGET_RE.match(spec)
+    if not match:
+        raise ValueError(f'Invalid budget {spec!r}, expected METRIC+N% or METRIC>X')
+    name, percent, limit = match.groups()
+    metric = METRIC_ALIASES.get(name.upper(), name)
+    if metric not in METRICS:
+        raise ValueError(f'Unknown metric {name!r} in budget {spec!r}')
+    if percent is not None:
+        return metric, 'relative', float(percent) / 100
+    return metric, 'absolute', float(limit)
+
+
+def check_budgets(entries, history, budgets, window=BASELINE_WINDOW):
+    """Check each entry against each budget.
+
+    Returns (violations, pending): one violation dict per entry and budget that
+    the entry exceeds, and one dict per entry and relative budget that could
+    not be checked yet for lack of MIN_BASELINE_RUNS earlier clean runs. Each
+    violating entry gets the budgets it broke in entry['violations']. Entries
+    marked accepted are only checked against absolute budgets.
+    """
+    violations, pending = [], []
+    for entry in entries:
+        for spec in budgets:
+            metric, kind, limit = parse_budget(spec)
+            value = entry['metrics'].get(metric)
+            if value is None:
+                continue
+            where = {'route': entry['route'], 'viewport': entry['viewport'], 'mode': entry['mode'], 'budget': spec}
+
+            if kind == 'absolute':
+                if value > limit:
+                    violations.append({**where, 'metric': metric, 'value': value, 'limit': limit})
+                    entry.setdefault('violations', []).append(spec)
+                continue
+
+            if entry.get('accepted'):
+                continue
+            base = baseline(history, entry['route'], entry['viewport'], entry['mode'], metric, window)
+            if not base or base['runs'] < MIN_BASELINE_RUNS:
+                pending.append({**where, 'runs': base['runs'] if base else 0})
+                continue
+            # Over budget relative to the median and outside the run-to-run spread
+            allowed = base['median'] * (1 + limit)
+            if value > allowed and value > base['p90']:
+                violations.append({**where, 'metric': metric, 'value': value, 'limit': round(allowed, 4),
+                                   'baseline': base})
+                entry.setdefault('violations', []).append(spec)
+    return violations, pending